@@ -17,6 +17,8 @@ from email.mime.application import MIMEApplication
 from streamlit_calendar import calendar
 import google.generativeai as genai 
 import io
+import random
+import threading
 
 # --------------------------------------------------------------------------
 # 1. 페이지 및 디자인 설정 (네이버 스마트스토어 테마 + 레이아웃 고정)
@@ -211,6 +213,16 @@ def clean_date_str(date_val):
         return f"{y}-{int(m):02d}-{int(d):02d}"
     return s
 
+# 시트 헤더 -> 앱 내부 컬럼명 통일 (load_data / 시트 쓰기 위치 계산에서 공용)
+RENAME_MAP = {
+    '주문일시': '날짜', '주문일': '날짜', '일자': '날짜',
+    '금액': '결제금액', '예상견적': '결제금액',
+    '성함': '구매자명', '고객명': '구매자명', '이름': '구매자명',
+    '상품': '상품명', '품목': '상품명',
+    '디자인파일': '디자인파일', '첨부파일': '디자인파일',
+    '상태': '상태', '진행상태': '상태'
+}
+
 def load_data(sheet_name):
     client = get_client()
     if not client: return pd.DataFrame(), None
@@ -223,15 +235,7 @@ def load_data(sheet_name):
         for col in ['날짜', '시작일', '종료일', '주문일시', '주문일']:
             if col in df.columns:
                 df[col] = df[col].apply(clean_date_str)
-        rename_map = {
-            '주문일시': '날짜', '주문일': '날짜', '일자': '날짜',
-            '금액': '결제금액', '예상견적': '결제금액',
-            '성함': '구매자명', '고객명': '구매자명', '이름': '구매자명',
-            '상품': '상품명', '품목': '상품명',
-            '디자인파일': '디자인파일', '첨부파일': '디자인파일',
-            '상태': '상태', '진행상태': '상태'
-        }
-        df.rename(columns=rename_map, inplace=True)
+        df.rename(columns=RENAME_MAP, inplace=True)
         df = df.loc[:, ~df.columns.duplicated()]
         if '주문처' not in df.columns: df['주문처'] = '🏠 자사몰'
         if '상태' not in df.columns: df['상태'] = '신규'
@@ -257,12 +261,247 @@ def update_status_in_sheet(sheet, row_data, new_status="완료"):
                     col_idx = i + 1
                     break
             if col_idx != -1:
-                sheet.update_cell(target_row_idx, col_idx, new_status)
-                return True, "✅ 상태 업데이트 성공!"
+                ok, msg = write_cells([(sheet, target_row_idx, col_idx, new_status)])[0]
+                if ok is False: return False, msg
+                return True, "✅ 상태 업데이트 성공!" if ok else msg
         return False, "❌ 주문 찾기 실패"
     except Exception as e:
         return False, f"❌ 오류: {str(e)}"
 
+def is_same_cell(a, b):
+    a_na = a is None or (not isinstance(a, str) and pd.isna(a))
+    b_na = b is None or (not isinstance(b, str) and pd.isna(b))
+    if a_na or b_na: return a_na and b_na
+    return a == b or str(a) == str(b)
+
+def to_cell_data(val):
+    # Sheets API CellData 변환 (빈 값은 {} -> 셀 비우기)
+    if val is None or (not isinstance(val, str) and pd.isna(val)): return {}
+    if pd.api.types.is_bool(val): return {"userEnteredValue": {"boolValue": bool(val)}}
+    if pd.api.types.is_number(val): return {"userEnteredValue": {"numberValue": float(val)}}
+    return {"userEnteredValue": {"stringValue": str(val)}}
+
+def build_diff_requests(sheet_id, header, base_df, edited_df):
+    """base_df(불러온 원본) 대비 edited_df 의 변경 셀/추가 행/삭제 행만 batch_update 요청으로 변환
+    -> (요청 리스트, 시트에 없는 열이라 저장되지 않는 수정된 열 이름 리스트)"""
+    # 앱 컬럼명 -> 시트 열 위치 (load_data 와 동일하게 첫 번째 중복 컬럼만 사용)
+    col_pos = {}
+    for j, h in enumerate(header):
+        col_pos.setdefault(RENAME_MAP.get(h.strip(), h.strip()), j)
+    cols = [c for c in edited_df.columns if c in col_pos and c in base_df.columns]
+    base_pos = {label: i for i, label in enumerate(base_df.index)}
+    added = edited_df[~edited_df.index.isin(base_df.index)]
+
+    # load_data 가 기본값으로 채워 넣은 열(주문처, 상태 등)은 시트에 없으므로 수정해도 저장할 곳이 없음
+    common = [l for l in edited_df.index if l in base_pos]
+    ignored = [c for c in edited_df.columns if c not in col_pos and c in base_df.columns and (
+        any(not is_same_cell(base_df.at[l, c], edited_df.at[l, c]) for l in common)
+        or any(not is_same_cell(None, v) for v in added[c]))]
+
+    # (1) 변경 셀: 원래 행 위치 기준, 같은 행의 연속된 열은 하나의 범위로 묶음
+    updates = []
+    for label, row in edited_df.iterrows():
+        if label not in base_pos: continue
+        base_row = base_df.loc[label]
+        changed = sorted((col_pos[c], row[c]) for c in cols if not is_same_cell(base_row[c], row[c]))
+        run = []
+        for j, val in changed + [(None, None)]:
+            if run and (j is None or j != run[-1][0] + 1):
+                updates.append({"updateCells": {
+                    "start": {"sheetId": sheet_id, "rowIndex": base_pos[label] + 1, "columnIndex": run[0][0]},
+                    "rows": [{"values": [to_cell_data(v) for _, v in run]}],
+                    "fields": "userEnteredValue"}})
+                run = []
+            if j is not None: run.append((j, val))
+
+    # (2) 삭제 행: 아래쪽부터 지워야 위쪽 행 번호가 밀리지 않음 (연속 구간은 한 번에)
+    deletes = []
+    for i in sorted((base_pos[l] for l in base_df.index if l not in edited_df.index), reverse=True):
+        if deletes and deletes[-1]["deleteDimension"]["range"]["startIndex"] == i + 2:
+            deletes[-1]["deleteDimension"]["range"]["startIndex"] = i + 1
+        else:
+            deletes.append({"deleteDimension": {"range": {
+                "sheetId": sheet_id, "dimension": "ROWS", "startIndex": i + 1, "endIndex": i + 2}}})
+
+    # (3) 추가 행: 시트 끝에 붙임
+    appends = []
+    if not added.empty:
+        rows = []
+        for _, row in added.iterrows():
+            values = [{} for _ in header]
+            for c in cols: values[col_pos[c]] = to_cell_data(row[c])
+            rows.append({"values": values})
+        appends.append({"appendCells": {"sheetId": sheet_id, "rows": rows, "fields": "userEnteredValue"}})
+
+    return updates + deletes + appends, ignored
+
+def save_sheet_diff(sheet, base_df, current_df, edited_df):
+    # 낙관적 동시성 체크: 편집을 시작한 뒤 시트가 바뀌었다면 덮어쓰지 않음
+    if not current_df.equals(base_df):
+        return False, "⚠️ 편집 중 다른 곳에서 시트가 변경되었습니다. 최신 데이터를 불러온 뒤 다시 수정해 주세요."
+    try:
+        header = sheet.row_values(1)
+        reqs, ignored = build_diff_requests(sheet.id, header, base_df, edited_df)
+        note = f" ('{', '.join(ignored)}' 열은 시트에 없는 열이라 수정 내용이 저장되지 않았습니다.)" if ignored else ""
+        if not reqs:
+            if ignored: return False, f"⚠️ 저장할 변경 사항이 없습니다.{note}"
+            return True, "변경 사항이 없습니다."
+        # 하나의 batch_update 로 전송 -> 전부 반영되거나 전부 실패 (시트가 비는 일 없음)
+        get_write_gateway().call(sheet.spreadsheet.batch_update, {"requests": reqs})
+        return True, f"✅ 변경된 {len(reqs)}개 범위만 저장되었습니다!{note}"
+    except Exception as e:
+        return False, f"❌ 저장 오류: {str(e)}"
+
+class WriteGateway:
+    """시트 쓰기 창구 (write-behind): 쓰기를 큐에 모아 두고 백그라운드 스레드가 잠시 모은 뒤
+    batch_update 로 전송. 일반 값은 같은 셀/범위의 마지막 값만 남기고,
+    재고 같은 증감(delta)은 셀별로 합산해서 전송 직전에 읽은 현재 값에 더함"""
+
+    def __init__(self, rate=1.0, burst=5, min_rate=0.1, max_retry=5, linger=0.5):
+        # 토큰 버킷 (초당 rate 회, 최대 burst 회 연속) - 429 가 나면 속도를 절반으로, 성공하면 서서히 복구
+        self.rate, self.max_rate, self.min_rate, self.burst = rate, rate, min_rate, burst
+        self.tokens, self.stamp = float(burst), time.monotonic()
+        self.max_retry = max_retry
+        self.linger = linger  # 첫 쓰기 후 이 시간 동안 들어온 쓰기를 함께 묶음
+        # (시트ID, A1 범위) -> {'book', 'values'(일반 값, 없으면 None), 'delta'(증감 합계), 'tickets'}
+        self.pending = {}
+        self.waiting = set()  # 결과를 기다리는 티켓 (기다리는 쪽이 없으면 결과를 보관하지 않음)
+        self.results = {}     # 티켓 -> (성공여부, 메시지)
+        self.seq = 0
+        self.bucket_lock = threading.Lock()
+        self.cond = threading.Condition()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def enqueue(self, sheet, row, col, values=None, delta=0):
+        if values is not None and not isinstance(values, list): values = [[values]]
+        rows, cols = (len(values), max(len(r) for r in values)) if values is not None else (1, 1)
+        start = gspread.utils.rowcol_to_a1(row, col)
+        end = gspread.utils.rowcol_to_a1(row + rows - 1, col + cols - 1)
+        title = sheet.title.replace("'", "''")
+        rng = f"'{title}'!{start}" if start == end else f"'{title}'!{start}:{end}"
+        with self.cond:
+            self.seq += 1
+            entry = self.pending.setdefault((sheet.spreadsheet.id, rng),
+                                            {'book': sheet.spreadsheet, 'values': None, 'delta': 0, 'tickets': []})
+            if values is not None:
+                # 일반 값: 이전 값/증감을 덮어씀 (티켓은 함께 완료 처리)
+                entry['values'], entry['delta'] = values, 0
+            entry['delta'] += delta
+            entry['tickets'].append(self.seq)
+            self.waiting.add(self.seq)
+            self.cond.notify_all()
+            return self.seq
+
+    def submit(self, sheet, row, col, values):
+        """(row, col) 부터 values(2차원 리스트 또는 단일 값)를 쓰도록 예약하고 티켓 번호를 돌려줌"""
+        return self.enqueue(sheet, row, col, values=values)
+
+    def submit_delta(self, sheet, row, col, delta):
+        """(row, col) 셀 값에 delta 를 더하도록 예약 - 전송 직전에 현재 값을 읽어서 더하므로 다른 쓰기와 겹쳐도 잃지 않음"""
+        return self.enqueue(sheet, row, col, delta=delta)
+
+    def take_token(self):
+        while True:
+            with self.bucket_lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def call(self, fn, *args, **kwargs):
+        """gspread 호출 하나를 토큰 버킷 + 429 재시도(지수 백오프)를 거쳐 실행 (append 등 합칠 수 없는 쓰기용)"""
+        for attempt in range(self.max_retry + 1):
+            self.take_token()
+            try:
+                result = fn(*args, **kwargs)
+                with self.bucket_lock: self.rate = min(self.max_rate, self.rate + 0.1)
+                return result
+            except gspread.exceptions.APIError as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status != 429 or attempt == self.max_retry: raise
+                with self.bucket_lock: self.rate = max(self.min_rate, self.rate / 2)
+                time.sleep(min(60, 2 ** attempt) + random.random())
+
+    def send_book(self, book, entries):
+        """한 스프레드시트 분량 전송 -> {티켓: (성공여부, 메시지)}"""
+        results, data = {}, []
+        # 일반 값 없이 증감만 있는 셀은 현재 값을 한 번에 읽어서 기준으로 삼음
+        reads = [rng for rng, e in entries if e['values'] is None and e['delta']]
+        base = {}
+        if reads:
+            resp = self.call(book.values_batch_get, reads, params={'valueRenderOption': 'UNFORMATTED_VALUE'})
+            for rng, vr in zip(reads, resp.get('valueRanges', [])):
+                base[rng] = (vr.get('values') or [['']])[0][0]
+        for rng, e in entries:
+            if not e['delta']:
+                if e['values'] is not None: data.append({"range": rng, "values": e['values']})
+                continue
+            cur = e['values'][0][0] if e['values'] is not None else base.get(rng, '')
+            num = pd.to_numeric(0 if cur == '' else cur, errors='coerce')
+            if pd.isna(num):
+                for t in e['tickets']: results[t] = (False, f"❌ 숫자가 아닌 셀이라 더할 수 없습니다: {rng} = {cur}")
+                continue
+            total = num + e['delta']
+            data.append({"range": rng, "values": [[int(total) if float(total).is_integer() else float(total)]]})
+        if data: self.call(book.values_batch_update, {"valueInputOption": "USER_ENTERED", "data": data})
+        for _, e in entries:
+            for t in e['tickets']: results.setdefault(t, (True, "✅ 반영 완료"))
+        return results
+
+    def run(self):
+        # 백그라운드 전송 스레드: 잠금은 큐를 꺼낼 때만 잡고, 전송/대기 중에는 잡지 않음
+        while True:
+            with self.cond:
+                while not self.pending: self.cond.wait()
+            time.sleep(self.linger)
+            with self.cond:
+                batch, self.pending = self.pending, {}
+            by_book = {}
+            for (book_id, rng), e in batch.items():
+                by_book.setdefault(book_id, (e['book'], []))[1].append((rng, e))
+            for book, entries in by_book.values():
+                try:
+                    results = self.send_book(book, entries)
+                except Exception as ex:
+                    results = {t: (False, f"❌ 쓰기 실패: {str(ex)}") for _, e in entries for t in e['tickets']}
+                with self.cond:
+                    for t, res in results.items():
+                        if t in self.waiting: self.results[t] = res
+                    self.cond.notify_all()
+
+    def wait(self, tickets, timeout=120):
+        """tickets 가 전송될 때까지 기다려 {티켓: (성공여부, 메시지)} 를 돌려줌
+        시간 안에 확인되지 않은 티켓은 (None, 메시지) - 실패가 아니라 아직 큐에 남아 곧 반영될 수 있음"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not all(t in self.results for t in tickets):
+                left = deadline - time.monotonic()
+                if left <= 0: break
+                self.cond.wait(left)
+            done = {}
+            for t in tickets:
+                self.waiting.discard(t)
+                done[t] = self.results.pop(t, (None, "⏳ 전송 대기 중: 아직 반영이 확인되지 않았습니다. 다시 입력하지 말고 잠시 후 새로고침해 확인해 주세요."))
+            return done
+
+@st.cache_resource
+def get_write_gateway():
+    # 모든 세션이 하나의 창구/속도 제한을 공유
+    return WriteGateway()
+
+def write_cells(writes, delta=False):
+    """[(sheet, row, col, value), ...] 를 쓰기 큐에 넣고 완료를 기다려 쓰기별 (성공여부, 메시지) 리스트를 돌려줌
+    delta=True 면 value 를 셀의 현재 값에 더함 (재고 증감용). 성공여부 None = 아직 확인 전(대기 중)"""
+    gw = get_write_gateway()
+    submit = gw.submit_delta if delta else gw.submit
+    tickets = [submit(sh, r, c, v) for sh, r, c, v in writes]
+    done = gw.wait(tickets)
+    return [done[t] for t in tickets]
+
 def get_drive_id(url):
     if not url: return None
     url = str(url)
@@ -317,6 +556,130 @@ def check_stock_and_alert(df_stock):
         return True
     return False
 
+# 📜 상담 히스토리: 고객별 1상담 = 1행 (추가만 하고 수정하지 않음)
+HISTORY_SHEET = "상담히스토리"
+HISTORY_HEADER = ['일시', '구매자명', '내용']
+
+def get_history_sheet():
+    client = get_client()
+    if not client: return None
+    book = client.open_by_key(SHEET_ID)
+    try:
+        return book.worksheet(HISTORY_SHEET)
+    except gspread.exceptions.WorksheetNotFound:
+        sheet = book.add_worksheet(title=HISTORY_SHEET, rows=1000, cols=len(HISTORY_HEADER))
+        get_write_gateway().call(sheet.append_row, HISTORY_HEADER)
+        return sheet
+
+@st.cache_resource(ttl=300)
+def load_history_index():
+    """{고객명: [(일시, 내용), ...] 최신순} - 시트 전체를 한 번만 읽어 고객별로 묶어 둠
+    (모든 세션이 같은 객체를 공유하므로 새 상담은 append_history 에서 직접 끼워 넣음)"""
+    # 읽기 실패는 예외로 올려서 빈 결과가 캐시되지 않도록 함
+    sheet = get_history_sheet()
+    if not sheet: raise RuntimeError("구글 시트 연결 실패")
+    df = pd.DataFrame(sheet.get_all_records())
+    index = {}
+    if df.empty or '구매자명' not in df.columns: return index
+    for _, r in df.iterrows():
+        index.setdefault(str(r['구매자명']), []).append((str(r.get('일시', '')), str(r.get('내용', ''))))
+    for entries in index.values():
+        # 최신순 (같은 시각이면 나중에 추가된 항목이 위로)
+        entries.reverse(); entries.sort(key=lambda e: e[0], reverse=True)
+    return index
+
+def append_history(customer, memo):
+    try:
+        sheet = get_history_sheet()
+        if not sheet: return False, "❌ 구글 시트 연결 실패"
+        now = datetime.now().strftime('%Y-%m-%d %H:%M')
+        get_write_gateway().call(sheet.append_row, [now, customer, memo], value_input_option='RAW')
+        # 시트를 다시 읽지 않고 캐시된 인덱스 맨 앞(최신)에 추가 (캐시가 막 새로 읽혔다면 이미 들어 있음)
+        entries = load_history_index().setdefault(customer, [])
+        if (now, memo) not in entries[:1]: entries.insert(0, (now, memo))
+        return True, "✅ 저장됨"
+    except Exception as e:
+        return False, f"❌ 오류: {str(e)}"
+
+def migrate_legacy_history():
+    """주문데이터 '비고' 칸에 누적돼 있던 기존 히스토리를 상담히스토리 시트로 옮김 (이미 옮긴 항목은 건너뜀)"""
+    try:
+        client = get_client(); sheet = get_history_sheet()
+        if not client or not sheet: return False, "❌ 구글 시트 연결 실패"
+        records = client.open("주문데이터").worksheet("시트1").get_all_records()
+        index = load_history_index()
+        rows, seen = [], set()
+        for rec in records:
+            name = rec.get('성함') or rec.get('구매자명') or rec.get('이름') or rec.get('고객명')
+            memo = str(rec.get('비고', '')).strip()
+            if not name or not memo: continue
+            # [YYYY-MM-DD HH:MM] 머리줄마다 새 상담, 그 아래 줄은 같은 상담의 이어지는 내용
+            # (첫 머리줄 이전의 내용만 일시 없는 상담 1건으로 처리)
+            entries = [['', '']]
+            for line in memo.splitlines():
+                m = re.match(r'^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2})\]\s?(.*)$', line)
+                if m: entries.append([m.group(1), m.group(2)])
+                else: entries[-1][1] += '\n' + line
+            for t, body in entries:
+                entry = (t, body.strip())
+                key = (str(name), entry)
+                if not entry[1] or key in seen or entry in index.get(str(name), []): continue
+                seen.add(key); rows.append([entry[0], str(name), entry[1]])
+        if rows: get_write_gateway().call(sheet.append_rows, rows, value_input_option='RAW')
+        load_history_index.clear()
+        return True, f"✅ {len(rows)}건 이관 완료"
+    except Exception as e:
+        return False, f"❌ 오류: {str(e)}"
+
+# 📅 일정: 시작일 기준으로 정렬된 날짜형 프레임 -> 날짜 구간 조회는 이진 탐색
+LONG_EVENT_SPAN = timedelta(days=31)  # 이보다 긴 일정(또는 종료일 오타)은 따로 보관해서 탐색 범위를 넓히지 않음
+
+@st.cache_data(ttl=300)
+def load_schedule_index():
+    """(일반 일정, 일반 일정의 최장 기간, 장기 일정) - 모두 시작일 정렬. 읽기 실패는 예외로 올려서 캐시되지 않도록 함"""
+    df, sheet = load_data("일정관리")
+    if sheet is None: raise RuntimeError("일정관리 시트 로드 실패")
+    if df.empty or '시작일' not in df.columns:
+        empty = pd.DataFrame(columns=['시작일', '종료일'])
+        return empty, timedelta(0), empty
+    df = df.copy()
+    df['시작일'] = pd.to_datetime(df['시작일'], errors='coerce')
+    end = pd.to_datetime(df['종료일'], errors='coerce') if '종료일' in df.columns else df['시작일']
+    df['종료일'] = end.fillna(df['시작일'])
+    df.loc[df['종료일'] < df['시작일'], '종료일'] = df['시작일']
+    df = df.dropna(subset=['시작일']).sort_values('시작일', kind='stable').reset_index(drop=True)
+    is_long = (df['종료일'] - df['시작일']) > LONG_EVENT_SPAN
+    short, long = df[~is_long].reset_index(drop=True), df[is_long].reset_index(drop=True)
+    max_span = (short['종료일'] - short['시작일']).max() if not short.empty else timedelta(0)
+    return short, max_span, long
+
+def schedule_in_window(sch_index, start, end):
+    """[start, end) 구간에 걸치는 일정만 반환 (일반 일정은 이진 탐색, 몇 안 되는 장기 일정은 항상 확인)"""
+    short, max_span, long = sch_index
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    lo = short['시작일'].searchsorted(start - max_span, side='left')
+    hi = short['시작일'].searchsorted(end, side='left')
+    part = short.iloc[lo:hi]
+    part = part[part['종료일'] >= start]
+    if long.empty: return part
+    long_part = long[(long['시작일'] < end) & (long['종료일'] >= start)]
+    if long_part.empty: return part
+    return pd.concat([part, long_part]).sort_values('시작일', kind='stable')
+
+def to_calendar_events(df):
+    events = []
+    for _, r in df.iterrows():
+        ev = {"title": str(r.get('일정명')), "start": r['시작일'].strftime('%Y-%m-%d')}
+        # 여러 날 일정: FullCalendar 종일 일정의 end 는 다음 날(미포함) 기준
+        if r['종료일'] > r['시작일']: ev["end"] = (r['종료일'] + timedelta(days=1)).strftime('%Y-%m-%d')
+        events.append(ev)
+    return events
+
+def month_window(day):
+    # 달력 월 화면에 보이는 앞뒤 주까지 포함
+    first = pd.Timestamp(day).normalize().replace(day=1)
+    return first - timedelta(days=7), first + pd.offsets.MonthBegin(1) + timedelta(days=14)
+
 # --------------------------------------------------------------------------
 # 🏠 메인 UI 로직
 # --------------------------------------------------------------------------
@@ -324,6 +687,7 @@ def check_stock_and_alert(df_stock):
 with st.sidebar:
     st.markdown("<h1 style='color:#800020;'>🍷 DUWELL</h1>", unsafe_allow_html=True)
     if st.button("🔄 데이터 새로고침", type="primary"):
+        st.cache_data.clear(); load_history_index.clear()
         st.rerun()
     menu = st.radio("메뉴 이동", [
         "🏠 통합 모니터링", "📦 주문 일괄 등록", "💎 고객 CRM 센터", 
@@ -369,13 +733,12 @@ if menu == "🏠 통합 모니터링":
     col_l, col_r = st.columns([1, 1])
     with col_l:
         st.subheader("📅 오늘의 일정")
-        df_sch, _ = load_data("일정관리")
-        if not df_sch.empty:
-            today_sch = df_sch[df_sch['시작일'] == today]
+        try:
+            today_sch = schedule_in_window(load_schedule_index(), today, pd.Timestamp(today) + timedelta(days=1))
             if not today_sch.empty:
                 for _, r in today_sch.iterrows(): st.info(f"⏰ {r.get('시간','')} | {r.get('일정명','')}")
             else: st.write("일정 없음")
-        else: st.write("일정 로드 실패")
+        except Exception: st.write("일정 로드 실패")
     with col_r:
         st.subheader("📦 최근 주문 (5건)")
         if not df_all.empty:
@@ -416,14 +779,16 @@ elif menu == "📦 주문 일괄 등록":
                                 str(row.get('주소', '')), str(row.get('상품명', '')), str(row.get('수량', '1')),
                                 str(row.get('결제금액', '0')), "", "", str(row.get('요청사항', '')), "", "신규(스마트스토어)"
                             ])
-                        sheet_main.append_rows(rows_to_add)
+                        get_write_gateway().call(sheet_main.append_rows, rows_to_add)
 
                         # (2) ✨ 지능형 재고 차감 로직 (매핑명 분석)
                         try:
                             df_opt, _ = load_data("옵션관리")
                             df_stock, sheet_stock = load_data("재고관리")
                             
+                            failed_items, queued_items = [], []
                             if not df_stock.empty and not df_opt.empty:
+                                deduct = {}  # 시트 행 번호 -> (상품명, 차감 수량 합계)
                                 for _, order in df_upload.iterrows():
                                     market_p_name = str(order.get('상품명', '')) # 주문서의 긴 이름
                                     order_qty = int(order.get('수량', 1))
@@ -441,21 +806,33 @@ elif menu == "📦 주문 일괄 등록":
                                     
                                     # 매칭된 상품의 재고 차감 실행
                                     if target_std_name:
-                                        stock_records = sheet_stock.get_all_records()
-                                        for idx, s_item in enumerate(stock_records):
+                                        # 방금 불러온 재고 데이터 사용 (시트 행 번호 = index + 2)
+                                        for idx, s_item in df_stock.iterrows():
                                             if str(s_item.get('상품명')).strip() == str(target_std_name).strip():
-                                                current_qty = int(s_item.get('현재재고', 0))
-                                                # B열(2열) 업데이트
-                                                sheet_stock.update_cell(idx + 2, 2, current_qty - order_qty)
+                                                row_no = int(idx) + 2
+                                                deduct[row_no] = (s_item['상품명'], deduct.get(row_no, (None, 0))[1] + order_qty)
                                                 break
-                            
+
+                                # B열(2열) 업데이트 - 차감량(delta)으로 전송해서 전송 시점의 현재 재고에서 빼도록 함
+                                if deduct:
+                                    results = write_cells([(sheet_stock, r, 2, -q) for r, (_, q) in deduct.items()], delta=True)
+                                    failed_items = [(name, msg) for (name, _), (ok, msg) in zip(deduct.values(), results) if ok is False]
+                                    queued_items = [name for (name, _), (ok, _) in zip(deduct.values(), results) if ok is None]
+
                             # 재고 부족 알림 체크
                             updated_stock, _ = load_data("재고관리")
                             check_stock_and_alert(updated_stock)
-                            
-                            st.success(f"✅ 총 {len(rows_to_add)}건 저장 및 지능형 재고 차감 완료!")
-                            time.sleep(2)
-                            st.rerun()
+
+                            if failed_items or queued_items:
+                                if failed_items:
+                                    st.warning(f"⚠️ 주문 {len(rows_to_add)}건은 저장되었으나 다음 상품의 재고 차감에 실패했습니다:\n\n"
+                                               + "\n".join(f"- {name}: {msg}" for name, msg in failed_items))
+                                if queued_items:
+                                    st.info("⏳ 다음 상품의 재고 차감은 전송 대기 중입니다 (다시 업로드하지 마세요): " + ", ".join(map(str, queued_items)))
+                            else:
+                                st.success(f"✅ 총 {len(rows_to_add)}건 저장 및 지능형 재고 차감 완료!")
+                                time.sleep(2)
+                                st.rerun()
 
                         except Exception as stock_err:
                             st.warning(f"⚠️ 주문은 저장되었으나 재고 차감 중 오류 발생: {stock_err}")
@@ -559,19 +936,38 @@ elif menu == "🎨 디자인 시안실":
 # === [6] 📅 일정 관리 ===
 elif menu == "📅 일정 관리":
     st.subheader("📅 일정 캘린더")
-    df_sch, sheet_sch = load_data("일정관리")
     col1, col2 = st.columns([1, 2])
     with col1:
         with st.form("add_schedule"):
             d_date = st.date_input("날짜"); d_time = st.time_input("시간"); d_title = st.text_input("일정명"); d_desc = st.text_area("상세내용")
             if st.form_submit_button("저장"):
-                if sheet_sch: sheet_sch.append_row([str(d_date), str(d_date), str(d_time), d_title, d_desc]); st.success("저장됨"); st.rerun()
+                try:
+                    sheet_sch = get_client().open_by_key(SHEET_ID).worksheet("일정관리")
+                    get_write_gateway().call(sheet_sch.append_row, [str(d_date), str(d_date), str(d_time), d_title, d_desc])
+                    load_schedule_index.clear(); st.success("저장됨"); st.rerun()
+                except Exception as e: st.error(f"저장 오류: {e}")
         audio_file = st.file_uploader("음성 일정 추가", type=['mp3', 'wav', 'm4a'])
         if audio_file and st.button("음성 분석"): st.info(process_audio(audio_file))
     with col2:
-        if not df_sch.empty:
-            events = [{"title": str(r.get('일정명')), "start": str(r.get('시작일'))} for _, r in df_sch.iterrows()]
-            calendar(events=events)
+        try:
+            sch_index = load_schedule_index()
+            # 달력에는 보고 있는 달(앞뒤 주 포함)의 일정만 전달
+            # streamlit-calendar 는 달 이동을 알려주는 콜백이 없으므로 이동 버튼을 직접 두고 달력 자체 이동 버튼은 숨김
+            if 'sch_month' not in st.session_state: st.session_state['sch_month'] = pd.Timestamp(datetime.now()).normalize().replace(day=1)
+            b_prev, b_today, b_next = st.columns(3)
+            if b_prev.button("◀ 이전 달"): st.session_state['sch_month'] -= pd.offsets.MonthBegin(1)
+            if b_today.button("오늘"): st.session_state['sch_month'] = pd.Timestamp(datetime.now()).normalize().replace(day=1)
+            if b_next.button("다음 달 ▶"): st.session_state['sch_month'] += pd.offsets.MonthBegin(1)
+            month = st.session_state['sch_month']
+            events = to_calendar_events(schedule_in_window(sch_index, *month_window(month)))
+            calendar(
+                events=events,
+                options={"initialView": "dayGridMonth", "initialDate": month.strftime('%Y-%m-%d'),
+                         "headerToolbar": {"left": "title", "center": "", "right": ""}},
+                callbacks=[],
+                key=f"sch_calendar_{month.strftime('%Y%m')}"  # 달이 바뀌면 새로 그려서 initialDate 적용
+            )
+        except Exception as e: st.caption(f"로드 오류: {e}")
 
 # === [7] 📋 주문 장부 ===
 elif menu == "📋 주문 장부":
@@ -592,23 +988,31 @@ elif menu == "🛠️ 옵션 관리":
         st.error("⚠️ 구글 시트 '옵션관리' 탭 맨 오른쪽에 '매핑명' 컬럼을 추가해 주세요!")
     
     if not df_opt.empty:
+        # 편집 기준 데이터(불러온 원본)는 저장 전까지 고정 -> 저장 시 이 원본과 비교해 변경분만 기록
+        if 'opt_base' not in st.session_state: st.session_state['opt_base'] = df_opt
+        df_base = st.session_state['opt_base']
+        if not df_base.equals(df_opt):
+            st.warning("⚠️ 편집을 시작한 뒤 시트 내용이 변경되었습니다.")
+            if st.button("🔄 최신 시트 불러오기"):
+                del st.session_state['opt_base']; st.rerun()
+
         # 표에서 직접 '매핑명'을 입력할 수 있도록 설정
         edited_df = st.data_editor(
-            df_opt, 
-            num_rows="dynamic", 
+            df_base,
+            num_rows="dynamic",
             use_container_width=True,
             key="opt_map_editor"
         )
-        
+
         if st.button("💾 설정 및 매핑명 저장"):
-            try:
-                sheet_opt.clear()
-                # 수정된 데이터를 헤더와 함께 시트에 다시 덮어씁니다.
-                sheet_opt.update([edited_df.columns.values.tolist()] + edited_df.values.tolist())
-                st.success("✅ '매핑명'을 포함한 모든 설정이 저장되었습니다!")
+            ok, msg = save_sheet_diff(sheet_opt, df_base, df_opt, edited_df)
+            if ok:
+                del st.session_state['opt_base']
+                st.success(msg)
+                time.sleep(1)
                 st.rerun()
-            except Exception as e:
-                st.error(f"저장 오류: {e}")
+            else:
+                st.error(msg)
 
     # 하단 가이드 (이미지 2번처럼 예시를 보여줌)
     with st.expander("💡 매핑명 입력 방법 (예시)"):
@@ -644,27 +1048,33 @@ elif menu == "💎 고객 CRM 센터":
                     with c_a:
                         st.markdown(f"### 👤 {sel['고객명']} 프로필")
                         st.markdown("#### 📜 상담 히스토리")
-                        current_history = ""
-                        try:
-                            client = get_client(); target_sh = client.open("주문데이터").worksheet("시트1")
-                            h = target_sh.row_values(1)
-                            if '비고' in h:
-                                cell = target_sh.find(sel['고객명'])
-                                if cell:
-                                    current_history = target_sh.cell(cell.row, h.index('비고')+1).value
-                                    st.text_area("기록", value=current_history or "내용 없음", height=150, disabled=True)
+                        history = []
+                        try: history = load_history_index().get(str(sel['고객명']), [])
                         except Exception as e: st.caption(f"로드 오류: {e}")
+                        if history:
+                            # 최신순 5건씩 페이지 단위로 표시
+                            page_size = 5
+                            n_pages = (len(history) - 1) // page_size + 1
+                            page = st.number_input(f"페이지 (총 {len(history)}건)", 1, n_pages, 1, key=f"hist_page_{sel['고객명']}") if n_pages > 1 else 1
+                            page_items = history[(page - 1) * page_size: page * page_size]
+                            st.text_area("기록", value="\n".join(f"[{t}] {m}" if t else m for t, m in page_items), height=150, disabled=True)
+                        else: st.text_area("기록", value="내용 없음", height=150, disabled=True)
                         memo_in = st.text_area("📝 신규 상담", key=f"memo_{sel['고객명']}")
                         if st.button("💾 누적 저장"):
-                            try:
-                                now = datetime.now().strftime('%Y-%m-%d %H:%M')
-                                final = f"{current_history}\n[{now}] {memo_in}" if current_history else f"[{now}] {memo_in}"
-                                target_sh.update_cell(cell.row, h.index('비고')+1, final)
-                                st.success("저장됨"); st.rerun()
-                            except Exception as e: st.error(f"오류: {e}")
+                            if not memo_in.strip(): st.warning("상담 내용을 입력하세요.")
+                            else:
+                                ok, msg = append_history(str(sel['고객명']), memo_in.strip())
+                                if ok: st.success(msg); st.rerun()
+                                else: st.error(msg)
                     with c_b:
                         st.markdown("### 🤖 AI 마케팅"); p_msg = f"{sel['고객명']}님을 위한 와인색 감성 메시지 작성해줘."
                         if st.button("✨ 문구 생성"): st.write(ask_ai(p_msg))
+                with st.expander("🗂️ 기존 '비고' 상담 기록 이관"):
+                    st.caption("'주문데이터' 시트 비고 칸에 쌓여 있던 상담 기록을 '상담히스토리' 시트로 옮깁니다. (중복 항목은 건너뜀)")
+                    if st.button("📥 기존 기록 이관"):
+                        ok, msg = migrate_legacy_history()
+                        if ok: st.success(msg)
+                        else: st.error(msg)
             with t2:
                 risk_df = cust_profile[cust_profile['상태']=='🔔 교체주기']
                 st.success(f"📍 재구매 알림 대상 ({len(risk_df)}명)"); st.dataframe(risk_df, hide_index=True)
@@ -713,11 +1123,14 @@ elif menu == "🛠️ 재고 관리":
                 qty = st.number_input("입고 수량", min_value=1)
                 if st.form_submit_button("입고 완료"):
                     try:
-                        cell = sheet_stock.find(target_p)
-                        curr = int(sheet_stock.cell(cell.row, 2).value)
-                        sheet_stock.update_cell(cell.row, 2, curr + qty)
-                        st.success("반영되었습니다.")
-                        st.rerun()
+                        # 방금 불러온 재고 데이터에서 행만 찾고, 수량은 증감(delta)으로 보내 전송 시점의 현재 재고에 더함
+                        idx = df_stock.index[df_stock['상품명'] == target_p][0]
+                        ok, msg = write_cells([(sheet_stock, int(idx) + 2, 2, qty)], delta=True)[0]
+                        if ok:
+                            st.success("반영되었습니다.")
+                            st.rerun()
+                        elif ok is None: st.info(msg)
+                        else: st.error(msg)
                     except Exception as e:
                         st.error(f"오류: {e}")
         with c_list: